@@ -0,0 +1,129 @@
+"""
+engine/batch.py — Multi-chapter production through the Message Batches API.
+
+Drafts for every chapter go out as one batch, then the rewrites as a
+second batch. Batched requests are billed at half the normal token price
+and are scheduled server-side, at the cost of latency: a batch can take
+minutes (up to 24h) to finish, so this is for whole-book runs, not the
+interactive Produce button.
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from engine.pipeline import (
+    MODEL, get_anthropic_client, style_hints, build_draft_request,
+    build_rewrite_request, postprocess_chapter, assemble_chapter_result,
+)
+
+BATCH_PRICE_MULTIPLIER = 0.5
+
+# Stages 4-6 are pure-Python CPU work and can be spread over worker processes.
+# They run at roughly 300k words/s on one core, while each spawned worker
+# pays about a second importing the engine and Streamlit, so the pool only
+# wins on very large batches (~3M characters, several books' worth).
+PARALLEL_POSTPROCESS_MIN_CHARS = 3_000_000
+
+
+def _run_batch(client, requests, poll_interval, timeout):
+    """Submit {custom_id: (system, prompt, max_tokens)} and wait for the results.
+
+    Returns {custom_id: (text, usage dict)}. Raises RuntimeError if the batch
+    times out or any request in it did not succeed.
+    """
+    batch = client.messages.batches.create(requests=[
+        {
+            "custom_id": custom_id,
+            "params": {
+                "model": MODEL,
+                "max_tokens": max_tokens,
+                "system": [{"type": "text", "text": system,
+                            "cache_control": {"type": "ephemeral"}}],
+                "messages": [{"role": "user", "content": prompt}],
+            },
+        }
+        for custom_id, (system, prompt, max_tokens) in requests.items()
+    ])
+
+    deadline = time.monotonic() + timeout
+    while batch.processing_status != "ended":
+        if time.monotonic() > deadline:
+            client.messages.batches.cancel(batch.id)
+            raise RuntimeError(f"Batch {batch.id} did not finish within {timeout}s")
+        time.sleep(poll_interval)
+        batch = client.messages.batches.retrieve(batch.id)
+
+    results = {}
+    failed = []
+    for entry in client.messages.batches.results(batch.id):
+        if entry.result.type != "succeeded":
+            failed.append(f"{entry.custom_id} ({entry.result.type})")
+            continue
+        message = entry.result.message
+        usage = message.usage
+        results[entry.custom_id] = (message.content[0].text, {
+            "input_tokens": usage.input_tokens,
+            "output_tokens": usage.output_tokens,
+            "cache_creation_input_tokens":
+                getattr(usage, "cache_creation_input_tokens", None) or 0,
+            "cache_read_input_tokens":
+                getattr(usage, "cache_read_input_tokens", None) or 0,
+        })
+    if failed:
+        raise RuntimeError(f"Batch {batch.id} requests failed: {', '.join(failed)}")
+    return results
+
+
+def produce_chapters_batch(bible_text, baseline_metrics, chapters,
+                           poll_interval=10, timeout=24 * 60 * 60):
+    """Produce several chapters with two Message Batches (drafts, then rewrites).
+
+    chapters is a list of (chapter_beats, scene_type) pairs, as for
+    produce_chapters. Results are returned in input order, in the same
+    shape as produce_chapter, with cost at the batch discount.
+    """
+    client = get_anthropic_client()
+    hints = style_hints(baseline_metrics)
+
+    # ---- STAGE 2: DRAFTS ----
+    draft_requests = {}
+    for i, (chapter_beats, scene_type) in enumerate(chapters):
+        draft_requests[f"draft-{i}"] = build_draft_request(
+            bible_text, hints, chapter_beats, scene_type)
+    drafts = _run_batch(client, draft_requests, poll_interval, timeout)
+
+    # ---- STAGE 3: REWRITES ----
+    rewrite_requests = {}
+    for i in range(len(chapters)):
+        draft_text = drafts[f"draft-{i}"][0]
+        max_tokens = draft_requests[f"draft-{i}"][2]
+        system, prompt = build_rewrite_request(hints, draft_text)
+        rewrite_requests[f"rewrite-{i}"] = (system, prompt, max_tokens)
+    rewrites = _run_batch(client, rewrite_requests, poll_interval, timeout)
+
+    # ---- STAGES 4-6 ----
+    texts = [rewrites[f"rewrite-{i}"][0] for i in range(len(chapters))]
+    scene_types = [scene_type for _, scene_type in chapters]
+    posts = _postprocess_all(texts, baseline_metrics, scene_types)
+
+    results = []
+    for i, (post, scene_type) in enumerate(zip(posts, scene_types)):
+        usages = (drafts[f"draft-{i}"][1], rewrites[f"rewrite-{i}"][1])
+        results.append(assemble_chapter_result(
+            post, scene_type, usages, price_multiplier=BATCH_PRICE_MULTIPLIER))
+    return results
+
+
+def _postprocess_all(texts, baseline_metrics, scene_types):
+    """Run postprocess_chapter over every chapter, across processes when worthwhile."""
+    workers = min(len(texts), os.cpu_count() or 1)
+    if workers < 2 or sum(map(len, texts)) < PARALLEL_POSTPROCESS_MIN_CHARS:
+        return [postprocess_chapter(text, baseline_metrics, scene_type)
+                for text, scene_type in zip(texts, scene_types)]
+    # spawn, not fork: the Streamlit server is multi-threaded
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        return list(pool.map(postprocess_chapter, texts,
+                             [baseline_metrics] * len(texts), scene_types))
@@ -20,12 +20,107 @@ Stages:
 
 import re
 import math
+import functools
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 import anthropic
 import streamlit as st
 
+logger = logging.getLogger(__name__)
 
+MODEL = "claude-sonnet-4-20250514"
+# The SDK retries 429/5xx/connection errors with exponential backoff and
+# honours retry-after; the default of 2 is tight for 10-60s chapter calls.
+API_MAX_RETRIES = 4
+
+# MODEL's list prices in USD per million tokens. Prompt-cache writes bill at
+# 1.25x the input rate and cache reads at 0.1x.
+INPUT_PRICE_PER_MTOK = 3.00
+OUTPUT_PRICE_PER_MTOK = 15.00
+CACHE_WRITE_PRICE_PER_MTOK = 3.75
+CACHE_READ_PRICE_PER_MTOK = 0.30
+
+
+@st.cache_resource
 def get_anthropic_client():
-    return anthropic.Anthropic(api_key=st.secrets["ANTHROPIC_API_KEY"])
+    # One client per server process: its httpx pool keeps connections (and
+    # TLS sessions) alive across reruns and across produce_chapters threads.
+    return anthropic.Anthropic(api_key=st.secrets["ANTHROPIC_API_KEY"],
+                               max_retries=API_MAX_RETRIES)
+
+
+# ---------------------------------------------------------------------------
+# Response cache
+# ---------------------------------------------------------------------------
+# Opt-in (config={"response_cache": True}). Identical draft/rewrite requests
+# are answered from memory instead of the API. Off by default so that
+# "Regenerate" still produces a fresh chapter.
+
+RESPONSE_CACHE_MAX_ENTRIES = 128
+
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+
+def _create_message(client, system, prompt, max_tokens, use_cache=False,
+                    on_text=None):
+    """Call the messages API and return (text, usage dict).
+
+    With on_text, the response is streamed and on_text(chunk) is called as
+    each piece of text arrives. A response-cache hit returns zero usage
+    since no tokens were billed.
+    """
+    key = None
+    if use_cache:
+        key = hashlib.sha256(json.dumps(
+            {"model": MODEL, "system": system, "prompt": prompt,
+             "max_tokens": max_tokens}, sort_keys=True).encode()).hexdigest()
+        with _response_cache_lock:
+            hit = _response_cache.get(key)
+            if hit is not None:
+                _response_cache.move_to_end(key)
+                return hit, {"input_tokens": 0, "output_tokens": 0,
+                             "cache_creation_input_tokens": 0,
+                             "cache_read_input_tokens": 0, "cached": True}
+
+    request = dict(
+        model=MODEL,
+        max_tokens=max_tokens,
+        system=[{"type": "text", "text": system,
+                 "cache_control": {"type": "ephemeral"}}],
+        messages=[{"role": "user", "content": prompt}]
+    )
+    if on_text is None:
+        response = client.messages.create(**request)
+    else:
+        with client.messages.stream(**request) as stream:
+            for chunk in stream.text_stream:
+                on_text(chunk)
+            response = stream.get_final_message()
+    text = response.content[0].text
+    # Prompt-cache fields are None when caching did not apply
+    usage = {
+        "input_tokens": response.usage.input_tokens,
+        "output_tokens": response.usage.output_tokens,
+        "cache_creation_input_tokens":
+            getattr(response.usage, "cache_creation_input_tokens", None) or 0,
+        "cache_read_input_tokens":
+            getattr(response.usage, "cache_read_input_tokens", None) or 0,
+        "cached": False,
+    }
+
+    if key is not None:
+        with _response_cache_lock:
+            _response_cache[key] = text
+            _response_cache.move_to_end(key)
+            while len(_response_cache) > RESPONSE_CACHE_MAX_ENTRIES:
+                _response_cache.popitem(last=False)
+    return text, usage
 
 
 # ---------------------------------------------------------------------------
@@ -39,6 +134,15 @@ SMOOTHING_WORDS = [
     'it is worth noting', 'it should be noted', 'needless to say'
 ]
 
+# Distinct corpora kept by build_baseline's cache (each key is a whole corpus)
+BASELINE_CACHE_MAX_ENTRIES = 16
+
+# max_tokens for the draft and rewrite calls
+DEFAULT_MAX_TOKENS = 4000
+MAX_TOKENS_FLOOR = 1024
+MAX_TOKENS_CEILING = 8000
+TOKENS_PER_TARGET_WORD = 2.0
+
 SCENE_TYPE_DIALOGUE_TARGETS = {
     "reflective": (0, 15),
     "social_confrontation": (45, 85),
@@ -47,18 +151,20 @@ SCENE_TYPE_DIALOGUE_TARGETS = {
     "procedural": (5, 30),
 }
 
-NON_ADVERBS = {'only', 'early', 'family', 'likely', 'belly', 'holy', 'ugly',
-               'lonely', 'friendly', 'elderly', 'daily', 'july', 'fly', 'reply',
-               'supply', 'ally', 'apply', 'rely', 'sally', 'billy', 'molly',
-               'emily', 'lily', 'fully', 'really', 'finally'}
-
-COMMON_STARTERS = {'the', 'a', 'an', 'it', 'he', 'she', 'they', 'we', 'i',
-                   'this', 'that', 'there', 'when', 'where', 'what', 'how',
-                   'but', 'and', 'so', 'if', 'as', 'in', 'on', 'at', 'for',
-                   'to', 'his', 'her', 'my', 'our', 'its', 'no', 'not', 'all',
-                   'one', 'two', 'some', 'any', 'every', 'each', 'after',
-                   'before', 'now', 'then', 'just', 'even', 'still', 'with',
-                   'from', 'by', 'up', 'out', 'down', 'back', 'over', 'through'}
+NON_ADVERBS = frozenset({
+    'only', 'early', 'family', 'likely', 'belly', 'holy', 'ugly',
+    'lonely', 'friendly', 'elderly', 'daily', 'july', 'fly', 'reply',
+    'supply', 'ally', 'apply', 'rely', 'sally', 'billy', 'molly',
+    'emily', 'lily', 'fully', 'really', 'finally'})
+
+COMMON_STARTERS = frozenset({
+    'the', 'a', 'an', 'it', 'he', 'she', 'they', 'we', 'i',
+    'this', 'that', 'there', 'when', 'where', 'what', 'how',
+    'but', 'and', 'so', 'if', 'as', 'in', 'on', 'at', 'for',
+    'to', 'his', 'her', 'my', 'our', 'its', 'no', 'not', 'all',
+    'one', 'two', 'some', 'any', 'every', 'each', 'after',
+    'before', 'now', 'then', 'just', 'even', 'still', 'with',
+    'from', 'by', 'up', 'out', 'down', 'back', 'over', 'through'})
 
 # Contamination words that are ALWAYS bad regardless of voice
 ALWAYS_BANNED = ['delve', 'tapestry', 'unbeknownst', 'a tapestry of',
@@ -66,72 +172,221 @@ ALWAYS_BANNED = ['delve', 'tapestry', 'unbeknownst', 'a tapestry of',
                  'pierced the silence', 'sent shivers', 'etched across',
                  'knuckles whitened']
 
+# Compiled once at import; these run over every corpus and chapter
+_RE_SENT_SPAN = re.compile(r'[^.!?]+')
+_RE_SENT_SPLIT_KEEP = re.compile(r'(?<=[.!?])\s+')
+_RE_SENT_SPLIT_SEP = re.compile(r'(?<=[.!?])(\s+)')
+_TAG_ALTERNATION = (
+    r'said|asked|replied|whispered|shouted|muttered|called|cried|answered|'
+    r'growled|hissed|exclaimed|declared|snapped|barked|sighed|groaned')
+# Dialogue tags and thought verbs in one scan, told apart by group name.
+# Dialogue spans stay a separate pattern: folded into the same alternation
+# they would swallow any tag inside the quotes. Punctuation stays on
+# str.count, which is a C loop and faster than any regex branch.
+_RE_TAG_THOUGHT_BASELINE = re.compile(
+    r'\b(?:(?P<tag>' + _TAG_ALTERNATION + r')|(?P<thought>'
+    r'thought|wondered|realized|knew|felt|remembered|imagined|hoped|'
+    r'feared|wished|believed|supposed|figured|guessed))\b',
+    re.IGNORECASE)
+_RE_TAG_THOUGHT_CHAPTER = re.compile(
+    r'\b(?:(?P<tag>' + _TAG_ALTERNATION + r')|(?P<thought>'
+    r'thought|wondered|realized|knew|felt|remembered|imagined|hoped|feared))\b',
+    re.IGNORECASE)
+# Impact words match as substrings, case-insensitively (as 'w in s.lower()' did)
+_RE_IMPACT = re.compile(
+    r'stopped|silence|nothing|gone|dead|dark|alone|screamed|ran|heard|'
+    r'waited|empty|still|quiet|frozen|cold',
+    re.IGNORECASE)
+_RE_EM_DASH = re.compile(r'(\w+)\s*\u2014\s*(\w+)')
+_RE_DOUBLE_HYPHEN = re.compile(r'(\w+)\s*--\s*(\w+)')
+_RE_DOUBLE_SPACE = re.compile(r'  +')
+_RE_TARGET_WORDS = re.compile(
+    r'Target word count:\s*(\d[\d,]*)(?:\s*(?:-|\u2013|\u2014|to)\s*(\d[\d,]*))?',
+    re.IGNORECASE)
+# Smoothing words as one alternation (longest first). The sentence-start
+# pattern takes a run of them ("However, indeed, the" -> "The") so the
+# sentence still starts with a capital once they're gone.
+_SMOOTHING_ALTERNATION = '|'.join(
+    re.escape(w) for w in sorted(SMOOTHING_WORDS, key=len, reverse=True))
+_RE_SMOOTHING_WORD = re.compile(_SMOOTHING_ALTERNATION, re.IGNORECASE)
+_RE_SMOOTHING_START = re.compile(
+    r'(?im)((?:^|\.\s+))(?:(?:' + _SMOOTHING_ALTERNATION + r'),?\s*)+(\w)')
+_RE_SMOOTHING_MID = re.compile(
+    r'(?i),?\s*(?:' + _SMOOTHING_ALTERNATION + r'),?\s*')
+
 
 # ---------------------------------------------------------------------------
-# STAGE 1: Baseline
+# Shared: text analysis (baseline corpus and produced chapters)
 # ---------------------------------------------------------------------------
 
-def build_baseline(corpus_text):
-    """Analyze corpus and return 14 voice metrics."""
-    words = corpus_text.split()
-    word_count = len(words)
-    sentences = [s.strip() for s in re.split(r'[.!?]+', corpus_text) if s.strip()]
-    num_sentences = max(len(sentences), 1)
-    avg_sl = word_count / num_sentences
-    paragraphs = [p.strip() for p in corpus_text.split('\n\n') if p.strip()]
-    fragments = sum(1 for s in sentences if len(s.split()) < 5)
-    em_dashes = corpus_text.count('\u2014') + corpus_text.count('--')
-    dialogue_lines = len(re.findall(r'"[^"]*"', corpus_text))
-
-    lengths = [len(s.split()) for s in sentences]
-    mean_len = sum(lengths) / max(len(lengths), 1)
-    variance = sum((l - mean_len) ** 2 for l in lengths) / max(len(lengths), 1)
-    stdev = variance ** 0.5
-
-    adverbs = sum(1 for w in words if w.lower().endswith('ly') and len(w) > 3
-                  and w.lower() not in NON_ADVERBS)
-
-    text_lower = corpus_text.lower()
-    smoothing_count = sum(text_lower.count(w) for w in SMOOTHING_WORDS)
-
-    all_tags = re.findall(
-        r'\b(said|asked|replied|whispered|shouted|muttered|called|cried|answered|'
-        r'growled|hissed|exclaimed|declared|snapped|barked|sighed|groaned)\b',
-        corpus_text, re.IGNORECASE)
-    said_count = sum(1 for t in all_tags if t.lower() == 'said')
-    said_ratio = (said_count / max(len(all_tags), 1)) * 100
-
-    sentence_starts = [s.split()[0] if s.split() else '' for s in sentences]
-    name_openers = sum(1 for w in sentence_starts
-                       if w and w[0].isupper() and len(w) > 1
-                       and w.lower() not in COMMON_STARTERS)
-    name_opener_pct = (name_openers / num_sentences) * 100
-
-    thought_verbs = len(re.findall(
-        r'\b(thought|wondered|realized|knew|felt|remembered|imagined|hoped|'
-        r'feared|wished|believed|supposed|figured|guessed)\b',
-        corpus_text, re.IGNORECASE))
-    interiority_pct = (thought_verbs / num_sentences) * 100
+def iter_sentences(text):
+    """Yield the stripped, non-empty spans between runs of . ! or ?
+
+    Same sentences as splitting on [.!?]+, without building the split list.
+    finditer keeps the scan in C; a per-character Python loop is ~3x slower.
+    """
+    for m in _RE_SENT_SPAN.finditer(text):
+        s = m.group().strip()
+        if s:
+            yield s
+
+
+def _scan_tags_and_thoughts(pattern, text):
+    """One pass over text: return (dialogue tags as written, thought-verb count)."""
+    tags = []
+    thoughts = 0
+    for m in pattern.finditer(text):
+        if m.lastgroup == 'tag':
+            tags.append(m.group('tag'))
+        else:
+            thoughts += 1
+    return tags, thoughts
+
+
+def _count_adverbs(words, _lower=str.lower, _na=NON_ADVERBS):
+    """Count -ly words that aren't in NON_ADVERBS (one lower() per word)."""
+    count = 0
+    for w in words:
+        if len(w) > 3:
+            lw = _lower(w)
+            if lw.endswith('ly') and lw not in _na:
+                count += 1
+    return count
+
+
+def _sentence_lengths_and_openers(sentences, _common=COMMON_STARTERS):
+    """Return (word count per sentence, name-opener count), splitting each sentence once.
+
+    A name opener is a capitalized first word that isn't a common starter.
+    """
+    lengths = []
+    openers = 0
+    for s in sentences:
+        words = s.split()
+        lengths.append(len(words))
+        if words:
+            w = words[0]
+            if w[0].isupper() and len(w) > 1 and w.lower() not in _common:
+                openers += 1
+    return lengths, openers
+
+
+def _length_stats(lengths):
+    """Return (mean, population stdev, fragment count) for sentence lengths.
+
+    Sums run in C (sum/map) and the variance numerator is exact integer
+    arithmetic, so there is no per-item Python loop beyond the fragment count.
+    """
+    n = len(lengths)
+    if not n:
+        return 0.0, 0.0, 0
+    total = sum(lengths)
+    total_sq = sum(map(int.__mul__, lengths, lengths))
+    variance = (n * total_sq - total * total) / (n * n)
+    fragments = sum(1 for l in lengths if l < 5)
+    return total / n, variance ** 0.5, fragments
+
+
+@dataclass
+class TextStats:
+    """Raw counts for one text, gathered in a single analysis pass."""
+    word_count: int
+    sentence_lengths: list
+    paragraph_count: int
+    mean_sentence_length: float
+    sentence_length_stdev: float
+    fragments: int
+    em_dashes: int
+    semicolons: int
+    exclamations: int
+    questions: int
+    dialogue_lines: int
+    adverbs: int
+    smoothing_count: int
+    tags: list
+    thought_verbs: int
+    name_openers: int
+    banned_phrases: list
+
+    @property
+    def sentence_count(self):
+        return max(len(self.sentence_lengths), 1)
+
+
+def analyze_text(text, tag_thought_pattern=_RE_TAG_THOUGHT_CHAPTER):
+    """Tokenize text once and collect every count the voice metrics need.
+
+    The baseline passes _RE_TAG_THOUGHT_BASELINE, which recognizes a longer
+    list of thought verbs than the chapter check.
+    """
+    words = text.split()
+    sentences = list(iter_sentences(text))
+    sentence_lengths, name_openers = _sentence_lengths_and_openers(sentences)
+    mean_sl, stdev, fragments = _length_stats(sentence_lengths)
+    tags, thought_verbs = _scan_tags_and_thoughts(tag_thought_pattern, text)
+    text_lower = text.lower()
+    return TextStats(
+        word_count=len(words),
+        sentence_lengths=sentence_lengths,
+        paragraph_count=sum(1 for p in text.split('\n\n') if p.strip()),
+        mean_sentence_length=mean_sl,
+        sentence_length_stdev=stdev,
+        fragments=fragments,
+        em_dashes=text.count('\u2014') + text.count('--'),
+        semicolons=text.count(';'),
+        exclamations=text.count('!'),
+        questions=text.count('?'),
+        # Non-overlapping "..." spans pair the straight quotes off two at a time
+        dialogue_lines=text.count('"') // 2,
+        adverbs=_count_adverbs(words),
+        smoothing_count=sum(text_lower.count(w) for w in SMOOTHING_WORDS),
+        tags=tags,
+        thought_verbs=thought_verbs,
+        name_openers=name_openers,
+        banned_phrases=[bw for bw in ALWAYS_BANNED if bw in text_lower],
+    )
+
 
+def _voice_metrics(stats, avg_sentence_length):
+    """The 14 voice metrics shared by the baseline and chapter metrics."""
+    word_count = max(stats.word_count, 1)
+    num_sentences = stats.sentence_count
+    paragraphs = max(stats.paragraph_count, 1)
+    said_count = sum(1 for t in stats.tags if t.lower() == 'said')
     return {
-        "avg_sentence_length": round(avg_sl, 1),
-        "sentence_length_stdev": round(stdev, 1),
-        "fragment_pct": round((fragments / num_sentences) * 100, 1),
-        "dialogue_ratio_pct": round((dialogue_lines / max(len(paragraphs), 1)) * 100, 1),
-        "avg_paragraph_length": round(word_count / max(len(paragraphs), 1), 1),
-        "em_dash_per_1k": round((em_dashes / max(word_count, 1)) * 1000, 1),
-        "semicolon_per_1k": round((corpus_text.count(';') / max(word_count, 1)) * 1000, 1),
-        "exclamation_per_1k": round((corpus_text.count('!') / max(word_count, 1)) * 1000, 1),
-        "question_per_1k": round((corpus_text.count('?') / max(word_count, 1)) * 1000, 1),
-        "interiority_pct": round(interiority_pct, 1),
-        "adverb_per_1k": round((adverbs / max(word_count, 1)) * 1000, 1),
-        "smoothing_per_1k": round((smoothing_count / max(word_count, 1)) * 1000, 1),
-        "name_opener_pct": round(name_opener_pct, 1),
-        "said_ratio_pct": round(said_ratio, 1),
-        "corpus_word_count": word_count
+        "avg_sentence_length": round(avg_sentence_length, 1),
+        "sentence_length_stdev": round(stats.sentence_length_stdev, 1),
+        "fragment_pct": round((stats.fragments / num_sentences) * 100, 1),
+        "dialogue_ratio_pct": round((stats.dialogue_lines / paragraphs) * 100, 1),
+        "avg_paragraph_length": round(stats.word_count / paragraphs, 1),
+        "em_dash_per_1k": round((stats.em_dashes / word_count) * 1000, 1),
+        "semicolon_per_1k": round((stats.semicolons / word_count) * 1000, 1),
+        "exclamation_per_1k": round((stats.exclamations / word_count) * 1000, 1),
+        "question_per_1k": round((stats.questions / word_count) * 1000, 1),
+        "interiority_pct": round((stats.thought_verbs / num_sentences) * 100, 1),
+        "adverb_per_1k": round((stats.adverbs / word_count) * 1000, 1),
+        "smoothing_per_1k": round((stats.smoothing_count / word_count) * 1000, 1),
+        "name_opener_pct": round((stats.name_openers / num_sentences) * 100, 1),
+        "said_ratio_pct": round((said_count / max(len(stats.tags), 1)) * 100, 1),
     }
 
 
+# ---------------------------------------------------------------------------
+# STAGE 1: Baseline
+# ---------------------------------------------------------------------------
+
+@st.cache_data(show_spinner=False, max_entries=BASELINE_CACHE_MAX_ENTRIES)
+def build_baseline(corpus_text):
+    """Analyze corpus and return 14 voice metrics.
+
+    Cached on the corpus text, so rebuilding an unchanged corpus is free.
+    """
+    stats = analyze_text(corpus_text, _RE_TAG_THOUGHT_BASELINE)
+    metrics = _voice_metrics(stats, stats.word_count / stats.sentence_count)
+    metrics["corpus_word_count"] = stats.word_count
+    return metrics
+
+
 # ---------------------------------------------------------------------------
 # STAGE 4.1: Em-dash Removal (CONDITIONAL)
 # ---------------------------------------------------------------------------
@@ -146,11 +401,17 @@ def remove_em_dashes(text):
         if after and after[0].islower():
             return f"{before}. {after[0].upper()}{after[1:]}"
         return f"{before}. {after}"
-    text = re.sub(r'(\w+)\s*\u2014\s*(\w+)', replace_em, text)
-    text = re.sub(r'(\w+)\s*--\s*(\w+)', replace_em, text)
+    # Each pass only runs when its dash is present; most chapters have one
+    # kind or none. The two kinds stay separate passes because a word between
+    # an em-dash and a double hyphen ("a \u2014 b--c") is rewritten by both.
+    if '\u2014' in text:
+        text = _RE_EM_DASH.sub(replace_em, text)
+    if '--' in text:
+        text = _RE_DOUBLE_HYPHEN.sub(replace_em, text)
     remaining = text.count('\u2014') + text.count('--')
-    text = text.replace('\u2014', '.').replace('--', '.')
-    count += remaining
+    if remaining:
+        text = text.replace('\u2014', '.').replace('--', '.')
+        count += remaining
     return text, count
 
 
@@ -159,35 +420,51 @@ def remove_em_dashes(text):
 # ---------------------------------------------------------------------------
 
 def remove_smoothing_words(text):
+    """Remove smoothing words; returns (text, number of occurrences removed)."""
     count = 0
-    for word in SMOOTHING_WORDS:
-        text_before = text
-        text = re.sub(
-            r'(?i)((?:^|\.\s+))' + re.escape(word) + r',?\s*(\w)',
-            lambda m: m.group(1) + m.group(2).upper(),
-            text, flags=re.MULTILINE
-        )
-        text = re.sub(r'(?i),?\s*' + re.escape(word) + r',?\s*', ' ', text)
-        if text != text_before:
-            count += 1
-    text = re.sub(r'  +', ' ', text)
-    return text, count
+    def replace_start(match):
+        nonlocal count
+        count += len(_RE_SMOOTHING_WORD.findall(match.group(0)))
+        return match.group(1) + match.group(2).upper()
+    text = _RE_SMOOTHING_START.sub(replace_start, text)
+    text, mid_count = _RE_SMOOTHING_MID.subn(' ', text)
+    text = _RE_DOUBLE_SPACE.sub(' ', text)
+    return text, count + mid_count
 
 
 # ---------------------------------------------------------------------------
 # STAGE 4.3: Opener Fix
 # ---------------------------------------------------------------------------
 
+PREP_PATTERNS = (
+    'in the', 'on the', 'at the', 'from the', 'by the',
+    'through the', 'across the', 'behind the', 'under the',
+    'with the', 'near the', 'past the', 'along the',
+)
+
+# first word -> [(priority, pattern words)], so each position is one lookup
+_PREP_BY_FIRST = {}
+for _rank, _prep in enumerate(PREP_PATTERNS):
+    _words = tuple(_prep.split())
+    _PREP_BY_FIRST.setdefault(_words[0], []).append((_rank, _words))
+del _rank, _prep, _words
+
+
 def fix_name_openers(text, target_pct=45.0):
-    sentences = re.split(r'(?<=[.!?])\s+', text)
+    # Keep the whitespace between sentences so paragraph breaks survive
+    parts = _RE_SENT_SPLIT_SEP.split(text)
+    sentences = parts[::2]
     if not sentences:
         return text, 0, 0
 
     name_opener_indices = []
+    common = COMMON_STARTERS
     for i, s in enumerate(sentences):
-        words = s.split()
-        if words and words[0][0:1].isupper() and len(words[0]) > 1:
-            if words[0].lower() not in COMMON_STARTERS:
+        # Only the first word matters here; don't split the whole sentence
+        words = s.split(None, 1)
+        if words:
+            first = words[0]
+            if first[0:1].isupper() and len(first) > 1 and first.lower() not in common:
                 name_opener_indices.append(i)
 
     current_pct = (len(name_opener_indices) / max(len(sentences), 1)) * 100
@@ -198,12 +475,6 @@ def fix_name_openers(text, target_pct=45.0):
     to_fix = len(name_opener_indices) - target_count
     fixes_made = 0
 
-    prep_patterns = [
-        'in the', 'on the', 'at the', 'from the', 'by the',
-        'through the', 'across the', 'behind the', 'under the',
-        'with the', 'near the', 'past the', 'along the',
-    ]
-
     for idx in name_opener_indices[2:]:
         if fixes_made >= to_fix:
             break
@@ -212,24 +483,21 @@ def fix_name_openers(text, target_pct=45.0):
         if len(words) < 6:
             continue
 
-        best_prep = None
-        best_prep_start = None
-        for prep in prep_patterns:
-            prep_words = prep.split()
-            prep_len = len(prep_words)
-            for wi in range(2, len(words) - prep_len - 1):
-                candidate = ' '.join(words[wi:wi + prep_len]).lower()
-                if candidate == prep:
-                    best_prep_start = wi
-                    best_prep = prep
-                    break
-            if best_prep:
-                break
-
-        if not best_prep or best_prep_start is None:
+        # Earliest pattern in PREP_PATTERNS wins, then its first position
+        lower_words = [w.lower() for w in words]
+        best = None
+        for wi in range(2, len(words) - 2):
+            for rank, prep_words in _PREP_BY_FIRST.get(lower_words[wi], ()):
+                prep_len = len(prep_words)
+                if (wi < len(words) - prep_len - 1
+                        and (best is None or rank < best[0])
+                        and tuple(lower_words[wi:wi + prep_len]) == prep_words):
+                    best = (rank, wi, prep_len)
+
+        if best is None:
             continue
 
-        prep_word_count = len(best_prep.split())
+        _, best_prep_start, prep_word_count = best
         phrase_end = min(best_prep_start + prep_word_count + 2, len(words))
         phrase_words = words[best_prep_start:phrase_end]
 
@@ -261,55 +529,74 @@ def fix_name_openers(text, target_pct=45.0):
             fixes_made += 1
 
     new_pct = (len(name_opener_indices) - fixes_made) / max(len(sentences), 1) * 100
-    return ' '.join(sentences), round(new_pct, 1), fixes_made
+    if not fixes_made:
+        return text, round(new_pct, 1), 0
+    parts[::2] = sentences
+    return ''.join(parts), round(new_pct, 1), fixes_made
 
 
 # ---------------------------------------------------------------------------
 # STAGE 4.4: Impact Paragraph Isolation
 # ---------------------------------------------------------------------------
 
+def _is_short_paragraph(p):
+    """True if p has at most two sentences; stops scanning at the third."""
+    n = 0
+    for _ in iter_sentences(p):
+        n += 1
+        if n > 2:
+            return False
+    return True
+
+
 def isolate_impact_paragraphs(text, target_pct=30.0):
-    paragraphs = text.split('\n\n')
+    paragraphs, pct, splits_made = _isolate_impact(text.split('\n\n'), target_pct)
+    if not splits_made:
+        return text, pct, 0
+    return '\n\n'.join(paragraphs), pct, splits_made
+
+
+def _isolate_impact(paragraphs, target_pct):
+    """isolate_impact_paragraphs on a paragraph list; returns (paragraphs, pct, splits)."""
     if not paragraphs:
-        return text, 0, 0
+        return paragraphs, 0, 0
 
-    short_count = sum(1 for p in paragraphs
-                      if len([s for s in re.split(r'[.!?]+', p) if s.strip()]) <= 2)
+    short_flags = [_is_short_paragraph(p) for p in paragraphs]
+    short_count = sum(short_flags)
     current_pct = (short_count / max(len(paragraphs), 1)) * 100
     if current_pct >= target_pct * 0.8:
-        return text, round(current_pct, 1), 0
+        return paragraphs, round(current_pct, 1), 0
 
     splits_made = 0
     new_paragraphs = []
-    impact_words = {'stopped', 'silence', 'nothing', 'gone', 'dead', 'dark',
-                    'alone', 'screamed', 'ran', 'heard', 'waited', 'empty',
-                    'still', 'quiet', 'frozen', 'cold'}
+    # Unchanged paragraphs keep their flag from above; only new pieces are rescanned
+    new_short = 0
 
-    for p in paragraphs:
-        sents = [s.strip() for s in re.split(r'(?<=[.!?])\s+', p) if s.strip()]
-        if len(sents) >= 4 and splits_made < 5:
+    for p, is_short in zip(paragraphs, short_flags):
+        if splits_made < 5:
+            sents = [s.strip() for s in _RE_SENT_SPLIT_KEEP.split(p) if s.strip()]
+        else:
+            sents = ()
+        if len(sents) >= 4:
             for i, s in enumerate(sents[1:-1], 1):
-                if (len(s.split()) <= 6 or
-                    any(w in s.lower() for w in impact_words)):
-                    before = ' '.join(sents[:i])
-                    impact = sents[i]
+                if len(s.split()) <= 6 or _RE_IMPACT.search(s):
+                    pieces = [' '.join(sents[:i]), sents[i]]
                     after = ' '.join(sents[i+1:])
-                    new_paragraphs.append(before)
-                    new_paragraphs.append(impact)
                     if after:
-                        new_paragraphs.append(after)
+                        pieces.append(after)
+                    new_paragraphs.extend(pieces)
+                    new_short += sum(1 for piece in pieces if _is_short_paragraph(piece))
                     splits_made += 1
                     break
             else:
                 new_paragraphs.append(p)
+                new_short += is_short
         else:
             new_paragraphs.append(p)
+            new_short += is_short
 
-    result = '\n\n'.join(new_paragraphs)
-    new_short = sum(1 for p in new_paragraphs
-                    if len([s for s in re.split(r'[.!?]+', p) if s.strip()]) <= 2)
     new_pct = (new_short / max(len(new_paragraphs), 1)) * 100
-    return result, round(new_pct, 1), splits_made
+    return new_paragraphs, round(new_pct, 1), splits_made
 
 
 # ---------------------------------------------------------------------------
@@ -317,7 +604,12 @@ def isolate_impact_paragraphs(text, target_pct=30.0):
 # ---------------------------------------------------------------------------
 
 def split_long_paragraphs(text, max_words=50):
-    paragraphs = text.split('\n\n')
+    paragraphs, splits_made = _split_long(text.split('\n\n'), max_words)
+    return '\n\n'.join(paragraphs), splits_made
+
+
+def _split_long(paragraphs, max_words):
+    """split_long_paragraphs on a paragraph list; returns (paragraphs, splits)."""
     new_paragraphs = []
     splits_made = 0
 
@@ -327,7 +619,7 @@ def split_long_paragraphs(text, max_words=50):
             new_paragraphs.append(p)
             continue
 
-        sents = [s.strip() for s in re.split(r'(?<=[.!?])\s+', p) if s.strip()]
+        sents = [s.strip() for s in _RE_SENT_SPLIT_KEEP.split(p) if s.strip()]
         if len(sents) < 2:
             new_paragraphs.append(p)
             continue
@@ -349,7 +641,7 @@ def split_long_paragraphs(text, max_words=50):
         if current_chunk:
             new_paragraphs.append(' '.join(current_chunk))
 
-    return '\n\n'.join(new_paragraphs), splits_made
+    return new_paragraphs, splits_made
 
 
 # ---------------------------------------------------------------------------
@@ -357,72 +649,26 @@ def split_long_paragraphs(text, max_words=50):
 # ---------------------------------------------------------------------------
 
 def compute_chapter_metrics(text):
-    words = text.split()
-    word_count = len(words)
-    sentences = [s.strip() for s in re.split(r'[.!?]+', text) if s.strip()]
-    num_sentences = max(len(sentences), 1)
-    sent_lengths = [len(s.split()) for s in sentences]
-    paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()]
-
-    mean_sl = sum(sent_lengths) / max(len(sent_lengths), 1)
-    variance = sum((l - mean_sl) ** 2 for l in sent_lengths) / max(len(sent_lengths), 1)
-    stdev = variance ** 0.5
-
-    fragments = sum(1 for l in sent_lengths if l < 5)
-    em_dashes = text.count('\u2014') + text.count('--')
-    dialogue_lines = len(re.findall(r'"[^"]*"', text))
-
-    adverbs = sum(1 for w in words if w.lower().endswith('ly') and len(w) > 3
-                  and w.lower() not in NON_ADVERBS)
-
-    all_tags = re.findall(
-        r'\b(said|asked|replied|whispered|shouted|muttered|called|cried|answered|'
-        r'growled|hissed|exclaimed|declared|snapped|barked|sighed|groaned)\b',
-        text, re.IGNORECASE)
-    said_count = sum(1 for t in all_tags if t.lower() == 'said')
-
-    smoothing_count = sum(text.lower().count(w) for w in SMOOTHING_WORDS)
-
-    thought_verbs = len(re.findall(
-        r'\b(thought|wondered|realized|knew|felt|remembered|imagined|hoped|feared)\b',
-        text, re.IGNORECASE))
-
-    sentence_starts = [s.split()[0] if s.split() else '' for s in sentences]
-    name_openers = sum(1 for w in sentence_starts
-                       if w and w[0].isupper() and len(w) > 1
-                       and w.lower() not in COMMON_STARTERS)
+    stats = analyze_text(text)
+    sent_lengths = stats.sentence_lengths
 
     clusters = 0
-    for i in range(len(sent_lengths) - 2):
-        a, b, c = sent_lengths[i], sent_lengths[i+1], sent_lengths[i+2]
+    for a, b, c in zip(sent_lengths, sent_lengths[1:], sent_lengths[2:]):
         if max(a, b, c) - min(a, b, c) <= 3:
             clusters += 1
 
-    has_dialogue = len(all_tags) > 0
-
-    return {
-        "avg_sentence_length": round(mean_sl, 1),
-        "sentence_length_stdev": round(stdev, 1),
-        "fragment_pct": round((fragments / num_sentences) * 100, 1),
-        "dialogue_ratio_pct": round((dialogue_lines / max(len(paragraphs), 1)) * 100, 1),
-        "avg_paragraph_length": round(word_count / max(len(paragraphs), 1), 1),
-        "em_dash_per_1k": round((em_dashes / max(word_count, 1)) * 1000, 1),
-        "semicolon_per_1k": round((text.count(';') / max(word_count, 1)) * 1000, 1),
-        "exclamation_per_1k": round((text.count('!') / max(word_count, 1)) * 1000, 1),
-        "question_per_1k": round((text.count('?') / max(word_count, 1)) * 1000, 1),
-        "interiority_pct": round((thought_verbs / num_sentences) * 100, 1),
-        "adverb_per_1k": round((adverbs / max(word_count, 1)) * 1000, 1),
-        "smoothing_per_1k": round((smoothing_count / max(word_count, 1)) * 1000, 1),
-        "name_opener_pct": round((name_openers / num_sentences) * 100, 1),
-        "said_ratio_pct": round((said_count / max(len(all_tags), 1)) * 100, 1),
-        "_word_count": word_count,
-        "_sentence_count": num_sentences,
-        "_rhythm_stdev": round(stdev, 1),
+    metrics = _voice_metrics(stats, stats.mean_sentence_length)
+    metrics.update({
+        "_word_count": stats.word_count,
+        "_sentence_count": stats.sentence_count,
+        "_rhythm_stdev": round(stats.sentence_length_stdev, 1),
         "_rhythm_clusters": clusters,
-        "_has_dialogue": has_dialogue,
-        "_all_tags": all_tags,
-        "_adverb_per_1k": round((adverbs / max(word_count, 1)) * 1000, 1),
-    }
+        "_has_dialogue": len(stats.tags) > 0,
+        "_all_tags": stats.tags,
+        "_banned_phrases": stats.banned_phrases,
+        "_adverb_per_1k": metrics["adverb_per_1k"],
+    })
+    return metrics
 
 
 # ---------------------------------------------------------------------------
@@ -432,13 +678,16 @@ def compute_chapter_metrics(text):
 def run_quality_gate(text, metrics, scene_type="reflective"):
     issues = []
     score = 0
-    text_lower = text.lower()
 
     # --- Contamination (always checked) ---
-    for bw in ALWAYS_BANNED:
-        if bw in text_lower:
-            issues.append(f"[CONTAMINATION] '{bw}'")
-            score += 3
+    # compute_chapter_metrics already scanned the lowercased text
+    banned = metrics.get("_banned_phrases")
+    if banned is None:
+        text_lower = text.lower()
+        banned = [bw for bw in ALWAYS_BANNED if bw in text_lower]
+    for bw in banned:
+        issues.append(f"[CONTAMINATION] '{bw}'")
+        score += 3
 
     # --- Dialogue tags (only with 3+ tags) ---
     if metrics["_has_dialogue"] and len(metrics["_all_tags"]) >= 3:
@@ -489,6 +738,14 @@ def run_quality_gate(text, metrics, scene_type="reflective"):
 # STAGE 6: Voice Delta
 # ---------------------------------------------------------------------------
 
+# The metrics compared against the baseline, in report order
+VOICE_DELTA_METRICS = (
+    "avg_sentence_length", "sentence_length_stdev", "fragment_pct",
+    "dialogue_ratio_pct", "avg_paragraph_length", "em_dash_per_1k",
+    "semicolon_per_1k", "exclamation_per_1k", "question_per_1k",
+    "interiority_pct", "adverb_per_1k", "smoothing_per_1k",
+    "name_opener_pct", "said_ratio_pct",
+)
 DIALOGUE_DEPENDENT_METRICS = {"said_ratio_pct", "dialogue_ratio_pct"}
 
 def compute_voice_delta(metrics, baseline_metrics, scene_type="reflective"):
@@ -496,11 +753,7 @@ def compute_voice_delta(metrics, baseline_metrics, scene_type="reflective"):
     has_dialogue = metrics.get("_has_dialogue", False)
 
     delta = {}
-    for metric in ["avg_sentence_length", "sentence_length_stdev", "fragment_pct",
-                    "dialogue_ratio_pct", "avg_paragraph_length", "em_dash_per_1k",
-                    "semicolon_per_1k", "exclamation_per_1k", "question_per_1k",
-                    "interiority_pct", "adverb_per_1k", "smoothing_per_1k",
-                    "name_opener_pct", "said_ratio_pct"]:
+    for metric in VOICE_DELTA_METRICS:
 
         chapter_val = metrics.get(metric, 0)
         baseline_val = baseline_metrics.get(metric, 0)
@@ -552,54 +805,100 @@ def compute_voice_delta(metrics, baseline_metrics, scene_type="reflective"):
 
 
 # ---------------------------------------------------------------------------
-# MAIN: produce_chapter (VOICE-AGNOSTIC)
+# Prompt builders (shared by produce_chapter and engine.batch)
 # ---------------------------------------------------------------------------
 
-def produce_chapter(bible_text, baseline_metrics, chapter_beats, scene_type, config=None):
-    client = get_anthropic_client()
+def _voice_target_str(baseline_metrics):
+    # Items stay in dict order: that order is the order of the prompt lines
+    return _format_voice_targets(tuple(baseline_metrics.items()))
 
-    # Build voice target string
+
+@functools.lru_cache(maxsize=8)
+def _format_voice_targets(metric_items):
+    """Format the baseline as prompt lines; cached since it's fixed for a book."""
     voice_targets = []
-    for metric, value in baseline_metrics.items():
+    for metric, value in metric_items:
         if metric == "corpus_word_count":
             continue
         label = metric.replace("_", " ").replace("pct", "%").replace("per 1k", "/1k")
         voice_targets.append(f"  - {label}: {value}")
-    voice_target_str = "\n".join(voice_targets)
-
-    # Determine style features from baseline
-    baseline_em = baseline_metrics.get("em_dash_per_1k", 0)
-    baseline_smooth = baseline_metrics.get("smoothing_per_1k", 0)
-    baseline_adverb = baseline_metrics.get("adverb_per_1k", 7)
-    baseline_interiority = baseline_metrics.get("interiority_pct", 4)
-    baseline_question = baseline_metrics.get("question_per_1k", 5)
-    baseline_exclamation = baseline_metrics.get("exclamation_per_1k", 2)
-    baseline_fragment = baseline_metrics.get("fragment_pct", 15)
-    baseline_avg_sl = baseline_metrics.get("avg_sentence_length", 12)
-    baseline_para = baseline_metrics.get("avg_paragraph_length", 25)
+    return "\n".join(voice_targets)
+
+
+@dataclass(frozen=True)
+class StyleHints:
+    """The baseline values the draft and rewrite prompts are written from.
+
+    Built once per baseline by style_hints() and shared by both prompt
+    builders (and by every chapter of a batch) instead of each builder
+    re-reading and re-formatting baseline_metrics.
+    """
+    voice_targets: str
+    em_dash_per_1k: float
+    smoothing_per_1k: float
+    adverb_per_1k: float
+    interiority_pct: float
+    question_per_1k: float
+    exclamation_per_1k: float
+    fragment_pct: float
+    avg_sentence_length: float
+    avg_paragraph_length: float
+
+
+def style_hints(baseline_metrics):
+    """Collect the prompt-facing baseline values, with the prompts' defaults."""
+    return StyleHints(
+        voice_targets=_voice_target_str(baseline_metrics),
+        em_dash_per_1k=baseline_metrics.get("em_dash_per_1k", 0),
+        smoothing_per_1k=baseline_metrics.get("smoothing_per_1k", 0),
+        adverb_per_1k=baseline_metrics.get("adverb_per_1k", 7),
+        interiority_pct=baseline_metrics.get("interiority_pct", 4),
+        question_per_1k=baseline_metrics.get("question_per_1k", 5),
+        exclamation_per_1k=baseline_metrics.get("exclamation_per_1k", 2),
+        fragment_pct=baseline_metrics.get("fragment_pct", 15),
+        avg_sentence_length=baseline_metrics.get("avg_sentence_length", 12),
+        avg_paragraph_length=baseline_metrics.get("avg_paragraph_length", 25),
+    )
 
-    # Determine target word count from chapter beats (look for word count mention)
-    # Default to 4000 max tokens, increase for longer chapters
-    max_tokens = 4000
-    if "3,000" in chapter_beats or "3000" in chapter_beats or "3,500" in chapter_beats:
-        max_tokens = 6000
-    elif "2,000" in chapter_beats or "2000" in chapter_beats or "2,500" in chapter_beats:
-        max_tokens = 5000
-    elif "1,500" in chapter_beats or "1500" in chapter_beats:
-        max_tokens = 4000
 
-    # ---- STAGE 2: DRAFT ----
-    draft_prompt = f"""You are a fiction ghostwriter. Write a chapter based on the project bible
-and chapter beats below. Match the author's voice EXACTLY as described in the bible.
+def max_tokens_for_beats(chapter_beats):
+    """Size max_tokens from the beats' "Target word count:" line.
+
+    Uses the top of the range (e.g. "3000-4000" -> 4000 words) at about two
+    tokens per word, which leaves room for the model running long. Falls back
+    to DEFAULT_MAX_TOKENS when the beats don't state a target.
+    """
+    match = _RE_TARGET_WORDS.search(chapter_beats)
+    if not match:
+        return DEFAULT_MAX_TOKENS
+    upper = int((match.group(2) or match.group(1)).replace(",", ""))
+    return min(MAX_TOKENS_CEILING,
+               max(MAX_TOKENS_FLOOR, int(upper * TOKENS_PER_TARGET_WORD)))
+
+
+def build_draft_request(bible_text, hints, chapter_beats, scene_type):
+    """Return (system, prompt, max_tokens) for the Stage 2 draft call."""
+    voice_target_str = hints.voice_targets
+    baseline_em = hints.em_dash_per_1k
+    baseline_smooth = hints.smoothing_per_1k
+    baseline_adverb = hints.adverb_per_1k
+    baseline_interiority = hints.interiority_pct
+    baseline_question = hints.question_per_1k
+    baseline_exclamation = hints.exclamation_per_1k
+    baseline_fragment = hints.fragment_pct
+    baseline_avg_sl = hints.avg_sentence_length
+    baseline_para = hints.avg_paragraph_length
+
+    max_tokens = max_tokens_for_beats(chapter_beats)
+
+    # Everything that is the same for every chapter of the book goes in a
+    # cached system block; only the beats and scene type change per call.
+    system = f"""You are a fiction ghostwriter. Write a chapter based on the project bible
+below and the chapter beats you are given. Match the author's voice EXACTLY as described in the bible.
 
 PROJECT BIBLE:
 {bible_text}
 
-CHAPTER TO WRITE:
-{chapter_beats}
-
-Scene type: {scene_type}
-
 VOICE METRICS FROM THE AUTHOR'S EXISTING WORK (match these closely):
 {voice_target_str}
 
@@ -619,24 +918,31 @@ METRIC TARGETS (from the author's corpus — match these PRECISELY):
 - Exclamations: ~{baseline_exclamation:.0f} exclamation marks per 1,000 words.
 - Average paragraph length: ~{baseline_para:.0f} words. {"Write LONG dense paragraphs of 4-8 sentences each. Do NOT break into short 1-2 sentence paragraphs unless at a major scene break." if baseline_para > 50 else "Keep paragraphs to 2-4 sentences."} Use blank lines between paragraphs.
 - Em-dashes: ~{baseline_em:.1f} per 1,000 words. {"Use em-dashes occasionally for parenthetical asides." if baseline_em > 0.2 else "Avoid em-dashes."}
-- Smoothing words: ~{baseline_smooth:.1f} per 1,000 words. {"Use occasionally where natural." if baseline_smooth > 0.2 else "Avoid smoothing words."}
+- Smoothing words: ~{baseline_smooth:.1f} per 1,000 words. {"Use occasionally where natural." if baseline_smooth > 0.2 else "Avoid smoothing words."}"""
+
+    prompt = f"""CHAPTER TO WRITE:
+{chapter_beats}
+
+Scene type: {scene_type}
 
 Write the chapter now. Prose only."""
+    return system, prompt, max_tokens
 
-    draft_response = client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=max_tokens,
-        messages=[{"role": "user", "content": draft_prompt}]
-    )
-    draft_text = draft_response.content[0].text
-    draft_input = draft_response.usage.input_tokens
-    draft_output = draft_response.usage.output_tokens
 
-    # ---- STAGE 3: CORRECTIVE REWRITE ----
-    rewrite_prompt = f"""You are a fiction editor. Rewrite the draft to better match the author's voice metrics.
+def build_rewrite_request(hints, draft_text):
+    """Return (system, prompt) for the Stage 3 corrective rewrite call."""
+    voice_target_str = hints.voice_targets
+    baseline_em = hints.em_dash_per_1k
+    baseline_smooth = hints.smoothing_per_1k
+    baseline_adverb = hints.adverb_per_1k
+    baseline_interiority = hints.interiority_pct
+    baseline_question = hints.question_per_1k
+    baseline_exclamation = hints.exclamation_per_1k
+    baseline_fragment = hints.fragment_pct
+    baseline_avg_sl = hints.avg_sentence_length
+    baseline_para = hints.avg_paragraph_length
 
-DRAFT:
-{draft_text}
+    system = f"""You are a fiction editor. Rewrite the draft you are given to better match the author's voice metrics.
 
 VOICE METRICS TO MATCH:
 {voice_target_str}
@@ -658,14 +964,20 @@ If the baseline shows long sentences, write LONG sentences. Match the numbers.
 
 Output ONLY the rewritten chapter. No commentary."""
 
-    rewrite_response = client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=max_tokens,
-        messages=[{"role": "user", "content": rewrite_prompt}]
-    )
-    text = rewrite_response.content[0].text
-    rewrite_input = rewrite_response.usage.input_tokens
-    rewrite_output = rewrite_response.usage.output_tokens
+    prompt = f"""DRAFT:
+{draft_text}"""
+    return system, prompt
+
+
+# ---------------------------------------------------------------------------
+# STAGES 4-6: post-processing, quality gate, voice delta
+# ---------------------------------------------------------------------------
+
+def postprocess_chapter(text, baseline_metrics, scene_type):
+    """Run Stages 4.1-6 on rewritten chapter text. Pure — no API calls."""
+    baseline_em = baseline_metrics.get("em_dash_per_1k", 0)
+    baseline_smooth = baseline_metrics.get("smoothing_per_1k", 0)
+    baseline_para = baseline_metrics.get("avg_paragraph_length", 25)
 
     # ---- CONDITIONAL POST-PROCESSING ----
     em_removed = 0
@@ -688,12 +1000,16 @@ Output ONLY the rewritten chapter. No commentary."""
     opener_target = min(baseline_metrics.get("name_opener_pct", 30) * 1.5, 55)
     text, opener_pct, openers_fixed = fix_name_openers(text, target_pct=opener_target)
 
+    # 4.4 + 4.5 share one paragraph list: split once, join once
+    paragraphs = text.split('\n\n')
+
     # 4.4: Impact paragraph isolation
-    text, impact_pct, impacts_split = isolate_impact_paragraphs(text)
+    paragraphs, impact_pct, impacts_split = _isolate_impact(paragraphs, 30.0)
 
     # 4.5: Paragraph splitter (target from baseline)
     para_max = max(int(baseline_para * 2.5), 60)
-    text, para_splits = split_long_paragraphs(text, max_words=para_max)
+    paragraphs, para_splits = _split_long(paragraphs, para_max)
+    text = '\n\n'.join(paragraphs)
 
     # ---- Compute metrics ----
     metrics = compute_chapter_metrics(text)
@@ -719,11 +1035,6 @@ Output ONLY the rewritten chapter. No commentary."""
     for issue in quality_report.get("issues", []):
         hotspots.append({"type": "issue", "text": issue})
 
-    # ---- Tokens ----
-    total_input = draft_input + rewrite_input
-    total_output = draft_output + rewrite_output
-    cost = (total_input / 1_000_000 * 3) + (total_output / 1_000_000 * 15)
-
     return {
         "chapter_text": text,
         "word_count": metrics["_word_count"],
@@ -731,24 +1042,67 @@ Output ONLY the rewritten chapter. No commentary."""
         "quality_report": quality_report,
         "voice_delta": voice_delta,
         "hotspots": hotspots,
+        "stages": ["draft", "rewrite",
+                   "em_dash_removal" if baseline_em < 1 else "em_dash_kept",
+                   "smoothing_removal" if baseline_smooth < 0.5 else "smoothing_kept",
+                   "opener_fix", "impact_isolation", "paragraph_split",
+                   "quality_gate", "voice_delta"],
+        "post_process": {
+            "em_dashes_removed": em_removed,
+            "smoothing_removed": smooth_removed,
+            "openers_fixed": openers_fixed,
+            "impacts_split": impacts_split,
+            "paragraphs_split": para_splits,
+        },
+    }
+
+
+def assemble_chapter_result(post, scene_type, usages, price_multiplier=1.0):
+    """Combine postprocess_chapter output with API usage into the final result.
+
+    price_multiplier scales the token cost (0.5 for the Message Batches API).
+    """
+    total_input = sum(u["input_tokens"] for u in usages)
+    total_output = sum(u["output_tokens"] for u in usages)
+    cache_write = sum(u["cache_creation_input_tokens"] for u in usages)
+    cache_read = sum(u["cache_read_input_tokens"] for u in usages)
+    cost = (total_input * INPUT_PRICE_PER_MTOK
+            + total_output * OUTPUT_PRICE_PER_MTOK
+            + cache_write * CACHE_WRITE_PRICE_PER_MTOK
+            + cache_read * CACHE_READ_PRICE_PER_MTOK) / 1_000_000
+    cost *= price_multiplier
+
+    # Share of prompt tokens served from the prompt cache; None if no tokens
+    # were billed (response-cache hits)
+    prompt_tokens = total_input + cache_write + cache_read
+    hit_ratio = round(cache_read / prompt_tokens, 3) if prompt_tokens else None
+    if prompt_tokens:
+        logger.info("Prompt cache: %d tokens read, %d written, %d uncached (%.0f%% hit)",
+                    cache_read, cache_write, total_input, hit_ratio * 100)
+    # Running totals for this process, not just this chapter
+    voice_targets = _format_voice_targets.cache_info()
+
+    return {
+        "chapter_text": post["chapter_text"],
+        "word_count": post["word_count"],
+        "quality_score": post["quality_score"],
+        "quality_report": post["quality_report"],
+        "voice_delta": post["voice_delta"],
+        "hotspots": post["hotspots"],
         "manifest": {
             "pipeline_version": "web-v4",
             "scene_type": scene_type,
-            "stages": ["draft", "rewrite",
-                       "em_dash_removal" if baseline_em < 1 else "em_dash_kept",
-                       "smoothing_removal" if baseline_smooth < 0.5 else "smoothing_kept",
-                       "opener_fix", "impact_isolation", "paragraph_split",
-                       "quality_gate", "voice_delta"],
-            "model": "claude-sonnet-4-20250514",
-            "post_process": {
-                "em_dashes_removed": em_removed,
-                "smoothing_removed": smooth_removed,
-                "openers_fixed": openers_fixed,
-                "impacts_split": impacts_split,
-                "paragraphs_split": para_splits,
-            },
+            "stages": post["stages"],
+            "model": MODEL,
+            "post_process": post["post_process"],
             "total_input_tokens": total_input,
-            "total_output_tokens": total_output
+            "total_output_tokens": total_output,
+            "cache_creation_input_tokens": cache_write,
+            "cache_read_input_tokens": cache_read,
+            "prompt_cache_hit_ratio": hit_ratio,
+            "voice_targets_hits": voice_targets.hits,
+            "voice_targets_misses": voice_targets.misses,
+            "response_cache_hits": sum(1 for u in usages if u.get("cached"))
         },
         "api_usage": {
             "input_tokens": total_input,
@@ -756,3 +1110,86 @@ Output ONLY the rewritten chapter. No commentary."""
             "cost": round(cost, 4)
         }
     }
+
+
+# ---------------------------------------------------------------------------
+# MAIN: produce_chapter (VOICE-AGNOSTIC)
+# ---------------------------------------------------------------------------
+
+def _word_progress(on_progress, stage):
+    """Adapt on_progress(stage, words) to a per-chunk on_text callback."""
+    if on_progress is None:
+        return None
+    words = 0
+    mid_word = False
+
+    def on_text(chunk):
+        nonlocal words, mid_word
+        if not chunk:
+            return
+        words += len(chunk.split())
+        # A word cut across two chunks was counted in both
+        if mid_word and not chunk[0].isspace():
+            words -= 1
+        mid_word = not chunk[-1].isspace()
+        on_progress(stage, words)
+    return on_text
+
+
+def produce_chapter(bible_text, baseline_metrics, chapter_beats, scene_type, config=None):
+    """Draft, rewrite and post-process one chapter.
+
+    config keys: "response_cache" (bool, see _create_message) and
+    "on_progress", a callable on_progress(stage, words) that turns on
+    streaming and is called as text arrives, with stage "draft" or
+    "rewrite" and the number of words received so far for that stage.
+    """
+    config = config or {}
+    use_response_cache = config.get("response_cache", False)
+    on_progress = config.get("on_progress")
+    client = get_anthropic_client()
+    hints = style_hints(baseline_metrics)
+
+    # ---- STAGE 2: DRAFT ----
+    draft_system, draft_prompt, max_tokens = build_draft_request(
+        bible_text, hints, chapter_beats, scene_type)
+    draft_text, draft_usage = _create_message(
+        client, draft_system, draft_prompt, max_tokens, use_response_cache,
+        on_text=_word_progress(on_progress, "draft"))
+
+    # ---- STAGE 3: CORRECTIVE REWRITE ----
+    rewrite_system, rewrite_prompt = build_rewrite_request(hints, draft_text)
+    text, rewrite_usage = _create_message(
+        client, rewrite_system, rewrite_prompt, max_tokens, use_response_cache,
+        on_text=_word_progress(on_progress, "rewrite"))
+
+    # ---- STAGES 4-6 ----
+    post = postprocess_chapter(text, baseline_metrics, scene_type)
+    return assemble_chapter_result(post, scene_type, (draft_usage, rewrite_usage))
+
+
+# ---------------------------------------------------------------------------
+# Multi-chapter production
+# ---------------------------------------------------------------------------
+
+def produce_chapters(bible_text, baseline_metrics, chapters, max_parallel=4, config=None,
+                     return_exceptions=False):
+    """Produce several chapters concurrently.
+
+    chapters is a list of (chapter_beats, scene_type) pairs. Each chapter's
+    draft → rewrite chain is still sequential, but the chains are almost all
+    API wait, so they run side by side — at most max_parallel in flight to
+    stay under rate limits. Results are returned in input order.
+    A config["on_progress"] callback is called from the worker threads.
+
+    With return_exceptions, a chapter that fails has its exception in its
+    place in the results instead of the first failure being raised, so
+    one bad call doesn't throw away the chapters that were paid for.
+    """
+    with ThreadPoolExecutor(max_workers=max_parallel) as pool:
+        futures = [pool.submit(produce_chapter, bible_text, baseline_metrics,
+                               chapter_beats, scene_type, config)
+                   for chapter_beats, scene_type in chapters]
+        if not return_exceptions:
+            return [future.result() for future in futures]
+        return [future.exception() or future.result() for future in futures]
@@ -74,6 +74,12 @@ CREATE TABLE api_usage (
     created_at TIMESTAMPTZ DEFAULT now()
 );
 
+-- Indexes for the project_id filters used by every read.
+-- bibles, baselines and chapters are already covered by their UNIQUE constraints.
+CREATE INDEX IF NOT EXISTS projects_user_idx ON projects (user_id, created_at);
+CREATE INDEX IF NOT EXISTS corpus_files_project_idx ON corpus_files (project_id, uploaded_at);
+CREATE INDEX IF NOT EXISTS api_usage_project_idx ON api_usage (project_id) INCLUDE (estimated_cost);
+
 -- Enable RLS and allow all (no auth, trusted users only)
 ALTER TABLE users ENABLE ROW LEVEL SECURITY;
 ALTER TABLE projects ENABLE ROW LEVEL SECURITY;
@@ -90,3 +96,105 @@ CREATE POLICY "Allow all" ON baselines FOR ALL USING (true) WITH CHECK (true);
 CREATE POLICY "Allow all" ON corpus_files FOR ALL USING (true) WITH CHECK (true);
 CREATE POLICY "Allow all" ON chapters FOR ALL USING (true) WITH CHECK (true);
 CREATE POLICY "Allow all" ON api_usage FOR ALL USING (true) WITH CHECK (true);
+
+
+-- ---------------------------------------------------------------------------
+-- Functions (called from storage.py via db.rpc)
+-- ---------------------------------------------------------------------------
+
+-- Cost aggregation — summed in Postgres so one number comes back, not every row
+CREATE OR REPLACE FUNCTION project_cost(pid UUID)
+RETURNS NUMERIC
+LANGUAGE sql STABLE
+AS $$
+    SELECT COALESCE(SUM(estimated_cost), 0) FROM api_usage WHERE project_id = pid;
+$$;
+
+CREATE OR REPLACE FUNCTION total_cost()
+RETURNS NUMERIC
+LANGUAGE sql STABLE
+AS $$
+    SELECT COALESCE(SUM(estimated_cost), 0) FROM api_usage;
+$$;
+
+-- Chapter save — picks the next version number and inserts in one round-trip.
+-- The advisory lock serializes concurrent saves of the same chapter.
+CREATE OR REPLACE FUNCTION save_chapter_version(
+    p_project_id UUID,
+    p_chapter_key TEXT,
+    p_chapter_title TEXT,
+    p_content TEXT,
+    p_word_count INTEGER,
+    p_quality_score INTEGER,
+    p_quality_report JSONB,
+    p_voice_delta JSONB,
+    p_hotspots JSONB,
+    p_manifest JSONB
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    new_version INTEGER;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext(p_project_id::TEXT || ':' || p_chapter_key));
+
+    INSERT INTO chapters (project_id, chapter_key, chapter_title, version, content,
+                          word_count, quality_score, quality_report, voice_delta,
+                          hotspots, manifest)
+    SELECT p_project_id, p_chapter_key, p_chapter_title, COALESCE(MAX(version), 0) + 1,
+           p_content, p_word_count, p_quality_score, p_quality_report, p_voice_delta,
+           p_hotspots, p_manifest
+    FROM chapters
+    WHERE project_id = p_project_id AND chapter_key = p_chapter_key
+    RETURNING version INTO new_version;
+
+    RETURN new_version;
+END;
+$$;
+
+-- Project creation — inserts the project and its starter bible atomically
+CREATE OR REPLACE FUNCTION create_project_with_bible(uid UUID, pname TEXT, bible TEXT)
+RETURNS projects
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    p projects;
+BEGIN
+    INSERT INTO projects (user_id, name) VALUES (uid, pname) RETURNING * INTO p;
+    INSERT INTO bibles (project_id, content) VALUES (p.id, bible);
+    RETURN p;
+END;
+$$;
+
+-- Latest version of every chapter (one row per project/chapter_key)
+CREATE OR REPLACE VIEW chapters_latest WITH (security_invoker = true) AS
+SELECT DISTINCT ON (project_id, chapter_key) *
+FROM chapters
+ORDER BY project_id, chapter_key, version DESC;
+
+-- Timestamps are set by the database, not sent by the client
+CREATE OR REPLACE FUNCTION set_updated_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.updated_at = now();
+    RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION set_built_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.built_at = now();
+    RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER bibles_updated_at BEFORE UPDATE ON bibles
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+CREATE OR REPLACE TRIGGER baselines_built_at BEFORE UPDATE ON baselines
+    FOR EACH ROW EXECUTE FUNCTION set_built_at();
@@ -7,8 +7,12 @@ The engine/ code never touches the database directly.
 
 from supabase import create_client
 import streamlit as st
-import json
-from datetime import datetime, timezone
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 
 DEFAULT_BIBLE_TEMPLATE = """# Project: My Novel
@@ -56,14 +60,70 @@ scene_type: [reflective/social_confrontation/action/intimate/procedural]
 """
 
 
+@st.cache_resource
 def get_client():
-    """Get or create Supabase client, cached per session."""
-    if "supabase_client" not in st.session_state:
-        st.session_state.supabase_client = create_client(
-            st.secrets["SUPABASE_URL"],
-            st.secrets["SUPABASE_KEY"]
-        )
-    return st.session_state.supabase_client
+    """Get the Supabase client, shared process-wide so its HTTP connection
+    pool (and keep-alive sockets) is reused across sessions and reruns."""
+    return create_client(
+        st.secrets["SUPABASE_URL"],
+        st.secrets["SUPABASE_KEY"]
+    )
+
+
+# --- Read cache ---
+# Streamlit reruns the whole script on every widget interaction, so the same
+# project reads repeat many times a minute. Read results are kept in a small
+# process-wide TTL/LRU cache; every write evicts the entries for its project.
+# Cached values are shared between callers and must not be mutated.
+
+CACHE_TTL_SECONDS = 30
+CACHE_MAX_ENTRIES = 1000
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cached(func):
+    """Cache a read keyed by (function name, *args). The first arg, if any, is the project id."""
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if kwargs:
+            # Bind keyword arguments into positional order, so the project id
+            # is still key[1] for _invalidate
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            args = tuple(bound.arguments.values())
+        key = (func.__name__,) + args
+        now = time.monotonic()
+        with _cache_lock:
+            entry = _cache.get(key)
+            if entry is not None and entry[0] > now:
+                _cache.move_to_end(key)
+                return entry[1]
+        value = func(*args)
+        with _cache_lock:
+            _cache[key] = (now + CACHE_TTL_SECONDS, value)
+            _cache.move_to_end(key)
+            while len(_cache) > CACHE_MAX_ENTRIES:
+                _cache.popitem(last=False)
+        return value
+    return wrapper
+
+
+def _invalidate(project_id: str):
+    """Evict cached reads for a project, plus cross-project aggregates."""
+    with _cache_lock:
+        for key in [k for k in _cache if len(k) == 1 or k[1] == project_id]:
+            del _cache[key]
+
+
+def _invalidate_project_lists():
+    """Evict every cached get_user_projects result (a project was added or removed)."""
+    with _cache_lock:
+        for key in [k for k in _cache if k[0] == "get_user_projects"]:
+            del _cache[key]
 
 
 # --- Users ---
@@ -71,7 +131,7 @@ def get_client():
 def get_or_create_user(username: str) -> dict:
     """Get existing user or create new one. Returns user row."""
     db = get_client()
-    result = db.table("users").select("*").eq("username", username).execute()
+    result = db.table("users").select("*").eq("username", username).limit(1).execute()
     if result.data:
         return result.data[0]
     result = db.table("users").insert({"username": username}).execute()
@@ -80,6 +140,7 @@ def get_or_create_user(username: str) -> dict:
 
 # --- Projects ---
 
+@_cached
 def get_user_projects(user_id: str) -> list:
     """Get all projects for a user."""
     db = get_client()
@@ -88,30 +149,32 @@ def get_user_projects(user_id: str) -> list:
 
 
 def create_project(user_id: str, name: str) -> dict:
-    """Create a new project with an empty bible."""
+    """Create a new project with an empty bible (one transaction, one round-trip)."""
     db = get_client()
-    result = db.table("projects").insert({"user_id": user_id, "name": name}).execute()
-    project = result.data[0]
-    # Create empty bible for this project
-    db.table("bibles").insert({
-        "project_id": project["id"],
-        "content": DEFAULT_BIBLE_TEMPLATE
+    result = db.rpc("create_project_with_bible", {
+        "uid": user_id,
+        "pname": name,
+        "bible": DEFAULT_BIBLE_TEMPLATE
     }).execute()
-    return project
+    _invalidate_project_lists()
+    return result.data
 
 
 def delete_project(project_id: str):
     """Delete a project and all its data (cascades)."""
     db = get_client()
     db.table("projects").delete().eq("id", project_id).execute()
+    _invalidate(project_id)
+    _invalidate_project_lists()
 
 
 # --- Bible ---
 
+@_cached
 def get_bible(project_id: str) -> str:
     """Get bible content for a project."""
     db = get_client()
-    result = db.table("bibles").select("content").eq("project_id", project_id).execute()
+    result = db.table("bibles").select("content").eq("project_id", project_id).limit(1).execute()
     if result.data:
         return result.data[0]["content"]
     return DEFAULT_BIBLE_TEMPLATE
@@ -122,22 +185,20 @@ def save_bible(project_id: str, content: str):
     db = get_client()
     db.table("bibles").upsert({
         "project_id": project_id,
-        "content": content,
-        "updated_at": datetime.now(timezone.utc).isoformat()
+        "content": content
     }, on_conflict="project_id").execute()
+    _invalidate(project_id)
 
 
 # --- Baseline ---
 
+@_cached
 def get_baseline(project_id: str) -> dict | None:
     """Get baseline metrics for a project, or None if not built."""
     db = get_client()
-    result = db.table("baselines").select("*").eq("project_id", project_id).execute()
+    result = db.table("baselines").select("*").eq("project_id", project_id).limit(1).execute()
     if result.data:
-        row = result.data[0]
-        if isinstance(row.get("metrics"), str):
-            row["metrics"] = json.loads(row["metrics"])
-        return row
+        return result.data[0]
     return None
 
 
@@ -147,50 +208,68 @@ def save_baseline(project_id: str, metrics: dict, word_count: int):
     db.table("baselines").upsert({
         "project_id": project_id,
         "metrics": metrics,
-        "corpus_word_count": word_count,
-        "built_at": datetime.now(timezone.utc).isoformat()
+        "corpus_word_count": word_count
     }, on_conflict="project_id").execute()
+    _invalidate(project_id)
 
 
 # --- Corpus Files ---
 
+@_cached
 def get_corpus_files(project_id: str) -> list:
-    """Get all uploaded writing samples for a project."""
+    """List uploaded writing samples for a project (metadata only, no content)."""
     db = get_client()
-    result = db.table("corpus_files").select("*").eq("project_id", project_id).order("uploaded_at").execute()
+    result = (db.table("corpus_files").select("id,filename,word_count,uploaded_at")
+              .eq("project_id", project_id)
+              .order("uploaded_at")
+              .execute())
     return result.data
 
 
+def get_corpus_contents(project_id: str) -> list:
+    """Get the text of every writing sample for a project, in upload order."""
+    db = get_client()
+    result = (db.table("corpus_files").select("content")
+              .eq("project_id", project_id)
+              .order("uploaded_at")
+              .execute())
+    return [row["content"] for row in result.data]
+
+
 def add_corpus_file(project_id: str, filename: str, content: str, word_count: int):
     """Add an uploaded writing sample."""
-    db = get_client()
-    db.table("corpus_files").insert({
-        "project_id": project_id,
-        "filename": filename,
-        "content": content,
-        "word_count": word_count
-    }).execute()
+    add_corpus_files(project_id, [(filename, content, word_count)])
+
 
+def add_corpus_files(project_id: str, files: list):
+    """Add several writing samples in one multi-row insert.
 
-def delete_corpus_file(file_id: str):
+    files is a list of (filename, content, word_count) tuples.
+    """
+    if not files:
+        return
+    db = get_client()
+    db.table("corpus_files").insert([
+        {
+            "project_id": project_id,
+            "filename": filename,
+            "content": content,
+            "word_count": word_count
+        }
+        for filename, content, word_count in files
+    ]).execute()
+    _invalidate(project_id)
+
+
+def delete_corpus_file(project_id: str, file_id: str):
     """Delete a corpus file."""
     db = get_client()
     db.table("corpus_files").delete().eq("id", file_id).execute()
+    _invalidate(project_id)
 
 
 # --- Chapters ---
 
-def get_chapters(project_id: str) -> list:
-    """Get all produced chapters for a project, latest versions first."""
-    db = get_client()
-    result = (db.table("chapters").select("*")
-              .eq("project_id", project_id)
-              .order("chapter_key")
-              .order("version", desc=True)
-              .execute())
-    return result.data
-
-
 def get_chapter(project_id: str, chapter_key: str, version: int = None) -> dict | None:
     """Get a specific chapter. Latest version if version not specified."""
     db = get_client()
@@ -203,40 +282,80 @@ def get_chapter(project_id: str, chapter_key: str, version: int = None) -> dict
         query = query.order("version", desc=True).limit(1)
     result = query.execute()
     if result.data:
-        row = result.data[0]
-        for field in ("quality_report", "voice_delta", "hotspots", "manifest"):
-            if isinstance(row.get(field), str):
-                row[field] = json.loads(row[field])
-        return row
+        return result.data[0]
     return None
 
 
+@_cached
+def get_latest_chapters(project_id: str) -> list:
+    """Get only the current (highest) version of each chapter, ordered by key.
+
+    The chapter text is left out (use get_chapter_content); the list only
+    needs the metadata and the voice delta.
+    """
+    db = get_client()
+    result = (db.table("chapters_latest")
+              .select("id,chapter_key,chapter_title,version,word_count,quality_score,voice_delta")
+              .eq("project_id", project_id)
+              .order("chapter_key")
+              .execute())
+    return result.data
+
+
+@_cached
+def get_chapter_content(project_id: str, chapter_id: str) -> str:
+    """Get the text of one chapter version by row id."""
+    db = get_client()
+    result = (db.table("chapters").select("content")
+              .eq("project_id", project_id)
+              .eq("id", chapter_id)
+              .limit(1)
+              .execute())
+    if result.data:
+        return result.data[0]["content"]
+    return ""
+
+
+@_cached
+def get_chapters_bulk(project_id: str, chapter_keys: tuple, columns: str = "*") -> dict:
+    """Get the latest version of several chapters in one query.
+
+    Returns {chapter_key: row} for the keys that have been produced. Pass
+    chapter_keys as a tuple (it is part of the cache key) and narrow
+    columns when the caller only needs metadata.
+    """
+    if not chapter_keys:
+        return {}
+    if columns != "*" and "chapter_key" not in columns.split(","):
+        columns = "chapter_key," + columns
+    db = get_client()
+    result = (db.table("chapters_latest").select(columns)
+              .eq("project_id", project_id)
+              .in_("chapter_key", list(chapter_keys))
+              .execute())
+    return {row["chapter_key"]: row for row in result.data}
+
+
 def save_chapter(project_id: str, chapter_key: str, chapter_title: str,
                  content: str, word_count: int, quality_score: int,
                  quality_report: dict, voice_delta: dict, hotspots: list,
-                 manifest: dict):
-    """Save a new chapter version."""
+                 manifest: dict) -> int:
+    """Save a new chapter version. Returns the version number assigned."""
     db = get_client()
-    existing = (db.table("chapters").select("version")
-                .eq("project_id", project_id)
-                .eq("chapter_key", chapter_key)
-                .order("version", desc=True)
-                .limit(1).execute())
-    version = (existing.data[0]["version"] + 1) if existing.data else 1
-
-    db.table("chapters").insert({
-        "project_id": project_id,
-        "chapter_key": chapter_key,
-        "chapter_title": chapter_title,
-        "version": version,
-        "content": content,
-        "word_count": word_count,
-        "quality_score": quality_score,
-        "quality_report": quality_report,
-        "voice_delta": voice_delta,
-        "hotspots": hotspots,
-        "manifest": manifest
+    result = db.rpc("save_chapter_version", {
+        "p_project_id": project_id,
+        "p_chapter_key": chapter_key,
+        "p_chapter_title": chapter_title,
+        "p_content": content,
+        "p_word_count": word_count,
+        "p_quality_score": quality_score,
+        "p_quality_report": quality_report,
+        "p_voice_delta": voice_delta,
+        "p_hotspots": hotspots,
+        "p_manifest": manifest
     }).execute()
+    _invalidate(project_id)
+    return result.data
 
 
 # --- API Usage ---
@@ -252,17 +371,43 @@ def log_api_usage(project_id: str, chapter_key: str,
         "output_tokens": output_tokens,
         "estimated_cost": cost
     }).execute()
+    _invalidate(project_id)
 
 
+@_cached
 def get_project_cost(project_id: str) -> float:
-    """Get total API cost for a project."""
+    """Get total API cost for a project (summed server-side)."""
     db = get_client()
-    result = db.table("api_usage").select("estimated_cost").eq("project_id", project_id).execute()
-    return sum(float(row["estimated_cost"]) for row in result.data)
+    result = db.rpc("project_cost", {"pid": project_id}).execute()
+    return float(result.data or 0)
 
 
+@_cached
 def get_total_cost() -> float:
-    """Get total API cost across all projects."""
+    """Get total API cost across all projects (summed server-side)."""
     db = get_client()
-    result = db.table("api_usage").select("estimated_cost").execute()
-    return sum(float(row["estimated_cost"]) for row in result.data)
+    result = db.rpc("total_cost", {}).execute()
+    return float(result.data or 0)
+
+
+# --- Snapshot ---
+
+_read_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="storage-read")
+
+
+def load_project_snapshot(project_id: str):
+    """Warm the read cache with everything the project tabs read, concurrently.
+
+    The reads are independent, so running them side by side costs one
+    round-trip instead of four. The tabs' own get_* calls during the same
+    rerun are then cache hits.
+    """
+    get_client()  # create the shared client on the calling thread
+    futures = [
+        _read_pool.submit(get_bible, project_id),
+        _read_pool.submit(get_baseline, project_id),
+        _read_pool.submit(get_corpus_files, project_id),
+        _read_pool.submit(get_latest_chapters, project_id),
+    ]
+    for future in futures:
+        future.result()
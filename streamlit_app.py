@@ -3,10 +3,10 @@ streamlit_app.py — Difference Engine Web Interface
 """
 
 import streamlit as st
-import json
+import bisect
 import re
+import pandas as pd
 import storage
-from engine.pipeline import build_baseline, produce_chapter
 
 # ---------------------------------------------------------------------------
 # Page Config
@@ -32,6 +32,11 @@ st.markdown("""
 # Helpers
 # ---------------------------------------------------------------------------
 
+# Quality score -> CSS class: <= 4 good, <= 10 ok, otherwise bad
+SCORE_CLASS_BOUNDS = (4, 10)
+SCORE_CLASSES = ("score-good", "score-ok", "score-bad")
+
+
 def read_uploaded_file(f) -> str:
     content = f.read()
     try:
@@ -40,11 +45,21 @@ def read_uploaded_file(f) -> str:
         return content.decode("latin-1")
 
 
+# Bible chapter-section patterns, compiled once (the parser reruns on every rerun)
+_RE_CHAPTER_HEADING = re.compile(
+    r'###\s+Chapter\s+(\d+)[:\s\u2014\u2013\-]+\s*([^\n]+)', re.IGNORECASE)
+_RE_H2 = re.compile(r'\n##\s')
+_RE_SCENE_TYPE = re.compile(r'scene_type:\s*(\w+)', re.IGNORECASE)
+_RE_BEAT = re.compile(r'-\s+Beat\s+\d+:\s*(.+)')
+_RE_ENDING = re.compile(r'-\s+Ending:\s*(.+)')
+_RE_TARGET_WORD_COUNT = re.compile(r'Target word count:\s*(.+)')
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
 def parse_chapter_beats(bible_text: str) -> list[dict]:
-    """Parse chapter beats from bible markdown."""
+    """Parse chapter beats from bible markdown (cached per bible text)."""
     chapters = []
-    pattern = r'###\s+Chapter\s+(\d+)[:\s\u2014\u2013\-]+\s*(.+?)(?=\n)'
-    matches = list(re.finditer(pattern, bible_text, re.IGNORECASE))
+    matches = list(_RE_CHAPTER_HEADING.finditer(bible_text))
 
     for i, match in enumerate(matches):
         num = match.group(1).strip()
@@ -57,22 +72,22 @@ def parse_chapter_beats(bible_text: str) -> list[dict]:
             section = bible_text[start:matches[i + 1].start()]
         else:
             # Go until next ## heading or end of file
-            next_h2 = re.search(r'\n##\s', bible_text[start:])
-            section = bible_text[start:start + next_h2.start()] if next_h2 else bible_text[start:]
+            next_h2 = _RE_H2.search(bible_text, start)
+            section = bible_text[start:next_h2.start()] if next_h2 else bible_text[start:]
 
         # Extract scene_type
-        scene_match = re.search(r'scene_type:\s*(\w+)', section, re.IGNORECASE)
+        scene_match = _RE_SCENE_TYPE.search(section)
         scene_type = scene_match.group(1) if scene_match else "reflective"
 
         # Extract beats
-        beats = re.findall(r'-\s+Beat\s+\d+:\s*(.+)', section)
+        beats = _RE_BEAT.findall(section)
 
         # Extract ending
-        ending_match = re.search(r'-\s+Ending:\s*(.+)', section)
+        ending_match = _RE_ENDING.search(section)
         ending = ending_match.group(1).strip() if ending_match else ""
 
         # Extract target word count
-        wc_match = re.search(r'Target word count:\s*(.+)', section)
+        wc_match = _RE_TARGET_WORD_COUNT.search(section)
         target_wc = wc_match.group(1).strip() if wc_match else "800-1000"
 
         chapters.append({
@@ -131,15 +146,17 @@ def render_sidebar():
         projects = storage.get_user_projects(user["id"])
 
         if projects:
-            project_names = [p["name"] for p in projects]
+            # Names are unique per user (schema), so they can key the lookup
+            projects_by_name = {p["name"]: p for p in projects}
+            project_names = list(projects_by_name)
             current_idx = 0
             if "project" in st.session_state:
                 current_name = st.session_state.project["name"]
-                if current_name in project_names:
+                if current_name in projects_by_name:
                     current_idx = project_names.index(current_name)
 
             selected = st.selectbox("📁 Project:", project_names, index=current_idx)
-            st.session_state.project = next(p for p in projects if p["name"] == selected)
+            st.session_state.project = projects_by_name[selected]
 
         st.markdown("---")
         new_name = st.text_input("New project name:")
@@ -160,6 +177,7 @@ def render_sidebar():
 # Bible Tab
 # ---------------------------------------------------------------------------
 
+@st.fragment
 def render_bible_tab():
     project = st.session_state.project
     bible_content = storage.get_bible(project["id"])
@@ -182,19 +200,27 @@ def render_bible_tab():
     st.markdown("#### Edit your bible")
     st.caption("Define your world, characters, voice rules, and chapter beats.")
 
-    edited = st.text_area(
-        "Bible content:",
-        value=bible_content,
-        height=500,
-        label_visibility="collapsed"
-    )
-
-    if st.button("💾 Save Bible", type="primary"):
-        storage.save_bible(project["id"], edited)
+    # A form, so edits don't rerun the whole app until they're saved
+    with st.form("bible_edit_form", border=False):
+        edited = st.text_area(
+            "Bible content:",
+            value=bible_content,
+            height=500,
+            label_visibility="collapsed"
+        )
+        submitted = st.form_submit_button("💾 Save Bible", type="primary")
+
+    if st.session_state.pop("bible_saved", False):
         st.success("Bible saved!")
+    if submitted:
+        storage.save_bible(project["id"], edited)
+        # Full rerun: the Produce tab's chapter list comes from the saved bible
+        st.session_state.bible_saved = True
+        st.rerun()
 
-    # Preview parsed chapters
-    chapters = parse_chapter_beats(edited)
+    # Preview the saved bible: the Produce tab parses the same text, so
+    # both tabs share one parse_chapter_beats cache entry
+    chapters = parse_chapter_beats(bible_content)
     if chapters:
         st.markdown("---")
         st.markdown(f"**{len(chapters)} chapters detected:**")
@@ -208,6 +234,17 @@ def render_bible_tab():
 # Baseline Tab
 # ---------------------------------------------------------------------------
 
+@st.cache_data(show_spinner=False, max_entries=32)
+def _fingerprint_df(metric_items: tuple) -> pd.DataFrame:
+    """The baseline metrics as a Metric/Value table (keyed on the metric values)."""
+    return pd.DataFrame([
+        {"Metric": key.replace("_", " ").replace("pct", "%").replace("per 1k", "/1k").title(),
+         "Value": val}
+        for key, val in metric_items
+    ])
+
+
+@st.fragment
 def render_baseline_tab():
     project = st.session_state.project
 
@@ -216,16 +253,11 @@ def render_baseline_tab():
         st.success(f"✅ Baseline built from {baseline['corpus_word_count']:,} words")
 
         metrics = baseline["metrics"]
-        if isinstance(metrics, str):
-            metrics = json.loads(metrics)
 
         st.markdown("#### Voice Fingerprint")
-        rows = []
-        for key, val in metrics.items():
-            label = key.replace("_", " ").replace("pct", "%").replace("per 1k", "/1k").title()
-            rows.append({"Metric": label, "Value": val})
-        if rows:
-            st.table(rows)
+        if metrics:
+            st.dataframe(_fingerprint_df(tuple(metrics.items())),
+                         hide_index=True, use_container_width=True)
 
         st.markdown("---")
 
@@ -238,12 +270,23 @@ def render_baseline_tab():
 
     if corpus:
         st.write(f"**{len(corpus)} files** ({total_words:,} words)")
-        for f in corpus:
-            col1, col2 = st.columns([5, 1])
-            col1.write(f"📄 {f['filename']} ({f['word_count']:,} words)")
-            if col2.button("🗑️", key=f"del_{f['id']}"):
-                storage.delete_corpus_file(f["id"])
-                st.rerun()
+        # One editor widget instead of a row of columns and a button per file.
+        # The key follows the file list, so ticks never carry over to other rows.
+        files_df = pd.DataFrame({
+            "Delete": False,
+            "File": [f["filename"] for f in corpus],
+            "Words": [f["word_count"] for f in corpus],
+        })
+        edited_files = st.data_editor(
+            files_df, hide_index=True, use_container_width=True,
+            disabled=["File", "Words"],
+            key=f"corpus_files_{hash(tuple(f['id'] for f in corpus))}"
+        )
+        to_delete = [f for f, tick in zip(corpus, edited_files["Delete"]) if tick]
+        if to_delete and st.button(f"🗑️ Delete {len(to_delete)} selected"):
+            for f in to_delete:
+                storage.delete_corpus_file(project["id"], f["id"])
+            st.rerun()
 
     uploaded = st.file_uploader(
         "Add writing samples:",
@@ -256,10 +299,11 @@ def render_baseline_tab():
         existing_names = {f["filename"] for f in corpus}
         new_files = [f for f in uploaded if f.name not in existing_names]
         if new_files:
+            rows = []
             for file in new_files:
                 content = read_uploaded_file(file)
-                word_count = len(content.split())
-                storage.add_corpus_file(project["id"], file.name, content, word_count)
+                rows.append((file.name, content, len(content.split())))
+            storage.add_corpus_files(project["id"], rows)
             st.rerun()
 
     # Build baseline
@@ -267,7 +311,10 @@ def render_baseline_tab():
     if total_words >= 5000:
         if st.button("🔬 Build Baseline", type="primary", use_container_width=True):
             with st.spinner("Analyzing your voice across 14 metrics..."):
-                all_text = "\n\n".join(f["content"] for f in corpus)
+                all_text = "\n\n".join(storage.get_corpus_contents(project["id"]))
+                # Imported on first use: engine.pipeline pulls in the anthropic
+                # SDK, which the login screen and most reruns never need
+                from engine.pipeline import build_baseline
                 metrics = build_baseline(all_text)
                 word_count = metrics.pop("corpus_word_count", total_words)
                 storage.save_baseline(project["id"], metrics, word_count)
@@ -284,6 +331,7 @@ def render_baseline_tab():
 # Produce Tab
 # ---------------------------------------------------------------------------
 
+@st.fragment
 def render_produce_tab():
     project = st.session_state.project
 
@@ -318,34 +366,52 @@ def render_produce_tab():
         if chapter_info['ending']:
             st.write(f"**Ending:** {chapter_info['ending']}")
 
-    # Existing versions
-    existing = storage.get_chapter(project["id"], chapter_info["chapter_key"])
+    # Existing versions — one cached query covers every chapter in the selector
+    latest = storage.get_chapters_bulk(
+        project["id"], tuple(ch["chapter_key"] for ch in chapters), "version,quality_score"
+    )
+    existing = latest.get(chapter_info["chapter_key"])
     if existing:
         st.info(f"Previous version exists (v{existing['version']}, score: {existing['quality_score']}). "
                 f"Producing again creates a new version.")
 
-    # Produce
+    _produce_section(project, baseline, bible_content, chapter_info)
+
+
+def _produce_section(project, baseline, bible_content, chapter_info):
+    """The Produce button, progress and result."""
     if st.button("⚙️ Produce Chapter", type="primary", use_container_width=True):
         progress = st.progress(0, text="Starting pipeline...")
 
         try:
             metrics = baseline["metrics"]
-            if isinstance(metrics, str):
-                metrics = json.loads(metrics)
 
             progress.progress(10, text="Building prompt...")
-            progress.progress(30, text="Generating chapter...")
 
+            drawn = {"stage": None, "words": 0}
+
+            def on_progress(stage, words):
+                # Streamed chunks are a few words each; redraw every ~25 words
+                if stage == drawn["stage"] and words - drawn["words"] < 25:
+                    return
+                drawn["stage"], drawn["words"] = stage, words
+                if stage == "draft":
+                    progress.progress(30, text=f"Drafting chapter... ~{words:,} words")
+                else:
+                    progress.progress(55, text=f"Rewriting chapter... ~{words:,} words")
+
+            from engine.pipeline import produce_chapter  # deferred: loads the anthropic SDK
             result = produce_chapter(
                 bible_text=bible_content,
                 baseline_metrics=metrics,
                 chapter_beats=chapter_info["raw_section"],
-                scene_type=chapter_info["scene_type"]
+                scene_type=chapter_info["scene_type"],
+                config={"on_progress": on_progress}
             )
 
             progress.progress(80, text="Saving results...")
 
-            storage.save_chapter(
+            version = storage.save_chapter(
                 project_id=project["id"],
                 chapter_key=chapter_info["chapter_key"],
                 chapter_title=chapter_info.get("title", ""),
@@ -368,72 +434,103 @@ def render_produce_tab():
                 )
 
             progress.progress(100, text="Complete!")
-
-            # Display results
-            score = result["quality_score"]
-            if score <= 4:
-                score_class = "score-good"
-            elif score <= 10:
-                score_class = "score-ok"
-            else:
-                score_class = "score-bad"
-
-            st.markdown(f'<div class="{score_class}">Quality Score: {score}</div>',
-                        unsafe_allow_html=True)
-            st.caption(f"{result['word_count']:,} words")
-
-            # Voice delta
-            if result.get("voice_delta"):
-                with st.expander("📊 Voice Delta", expanded=True):
-                    delta_rows = []
-                    for metric, data in result["voice_delta"].items():
-                        if isinstance(data, dict):
-                            delta_rows.append({
-                                "Metric": metric.replace("_", " ").title(),
-                                "Baseline": data.get("baseline", "—"),
-                                "Chapter": data.get("chapter", "—"),
-                                "Severity": data.get("severity", "—")
-                            })
-                    if delta_rows:
-                        st.table(delta_rows)
-
-            # Chapter text
-            st.markdown("---")
-            st.markdown("#### Chapter Text")
-            st.text_area("", value=result["chapter_text"], height=400,
-                         label_visibility="collapsed", disabled=True)
-
-            st.download_button(
-                "📥 Download as .md",
-                data=result["chapter_text"],
-                file_name=f"{chapter_info['chapter_key']}.md",
-                mime="text/markdown"
-            )
-
         except Exception as e:
             st.error(f"Production failed: {e}")
             import traceback
             st.code(traceback.format_exc())
+        else:
+            # Full rerun, not just this tab: the Chapters tab and the sidebar
+            # cost need the new version. The result is shown on the way back.
+            st.session_state.produced = (chapter_info["chapter_key"], version, result)
+            st.rerun()
+
+    produced = st.session_state.pop("produced", None)
+    if produced and produced[0] == chapter_info["chapter_key"]:
+        _show_produced_chapter(project, *produced)
+
+
+def _show_produced_chapter(project, chapter_key, version, result):
+    """The score, voice delta and text of a chapter that was just produced."""
+    score = result["quality_score"]
+    score_class = SCORE_CLASSES[bisect.bisect_left(SCORE_CLASS_BOUNDS, score)]
+
+    st.markdown(f'<div class="{score_class}">Quality Score: {score}</div>',
+                unsafe_allow_html=True)
+    st.caption(f"{result['word_count']:,} words")
+
+    # Voice delta
+    if result.get("voice_delta"):
+        with st.expander("📊 Voice Delta", expanded=True):
+            delta_df = _voice_delta_df((project["id"], chapter_key, version),
+                                       result["voice_delta"])
+            if not delta_df.empty:
+                st.dataframe(delta_df, hide_index=True, use_container_width=True)
+
+    # Chapter text
+    st.markdown("---")
+    st.markdown("#### Chapter Text")
+    with st.container(height=400):
+        st.code(result["chapter_text"], language=None, wrap_lines=True)
+
+    st.download_button(
+        "📥 Download as .md",
+        data=result["chapter_text"],
+        file_name=f"{chapter_key}.md",
+        mime="text/markdown"
+    )
 
 
 # ---------------------------------------------------------------------------
 # Chapters Tab
 # ---------------------------------------------------------------------------
 
+CHAPTERS_PER_PAGE = 10
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _voice_delta_df(version_key: tuple, _delta) -> pd.DataFrame:
+    """A chapter's voice delta as a table.
+
+    Keyed on (project id, chapter key, version) alone: a saved chapter
+    version is never modified (producing again inserts a new row), so the
+    key pins the delta and it doesn't need to be hashed on every rerun.
+    The Produce result and the Chapters tab share the entry.
+    """
+    rows = []
+    for metric, data in _delta.items():
+        if isinstance(data, dict):
+            rows.append({
+                "Metric": metric.replace("_", " ").title(),
+                "Baseline": data.get("baseline", ""),
+                "Chapter": data.get("chapter", ""),
+                "Severity": data.get("severity", "")
+            })
+    return pd.DataFrame(rows)
+
+
+@st.fragment
 def render_chapters_tab():
     project = st.session_state.project
-    chapters = storage.get_chapters(project["id"])
+    chapters = storage.get_latest_chapters(project["id"])
 
     if not chapters:
         st.info("No chapters produced yet. Go to the **Produce** tab!")
         return
 
-    seen = set()
+    # Expanders send their body to the browser even when collapsed, so only
+    # one page of chapters is rendered per rerun
+    pages = (len(chapters) + CHAPTERS_PER_PAGE - 1) // CHAPTERS_PER_PAGE
+    if pages > 1:
+        page = st.selectbox(
+            "Chapters:", range(pages),
+            format_func=lambda i: f"{i * CHAPTERS_PER_PAGE + 1}–"
+                                  f"{min((i + 1) * CHAPTERS_PER_PAGE, len(chapters))}"
+                                  f" of {len(chapters)}",
+            key="chapters_page")
+        chapters = chapters[page * CHAPTERS_PER_PAGE:(page + 1) * CHAPTERS_PER_PAGE]
+
     for ch in chapters:
         key = ch["chapter_key"]
-        if key in seen:
-            continue
-        seen.add(key)
 
         title = ch.get("chapter_title", key)
         score = ch.get("quality_score", "?")
@@ -443,27 +540,28 @@ def render_chapters_tab():
         with st.expander(f"📄 {title} (v{version}) — Score: {score} — {words:,} words"):
             delta = ch.get("voice_delta")
             if delta:
-                if isinstance(delta, str):
-                    delta = json.loads(delta)
-                rows = []
-                for metric, data in delta.items():
-                    if isinstance(data, dict):
-                        rows.append({
-                            "Metric": metric.replace("_", " ").title(),
-                            "Baseline": data.get("baseline", ""),
-                            "Chapter": data.get("chapter", ""),
-                            "Severity": data.get("severity", "")
-                        })
-                if rows:
-                    st.table(rows)
-
-            st.text_area("", value=ch["content"], height=300,
-                        label_visibility="collapsed", disabled=True,
-                        key=f"ch_text_{ch['id']}")
+                delta_df = _voice_delta_df((project["id"], key, version), delta)
+                if not delta_df.empty:
+                    st.dataframe(delta_df, hide_index=True, use_container_width=True)
+
+            # The text is fetched on request: collapsed expanders still ship
+            # their contents, and most chapters are never opened
+            loaded_key = f"ch_loaded_{ch['id']}"
+            if not st.session_state.get(loaded_key):
+                if st.button("📖 Load text", key=f"load_{ch['id']}"):
+                    st.session_state[loaded_key] = True
+                else:
+                    continue
+            content = storage.get_chapter_content(project["id"], ch["id"])
+
+            # Read-only, so a verbatim code block rather than a disabled
+            # widget that round-trips the whole text as widget state
+            with st.container(height=300):
+                st.code(content, language=None, wrap_lines=True)
 
             st.download_button(
                 "📥 Download",
-                data=ch["content"],
+                data=content,
                 file_name=f"{key}_v{version}.md",
                 mime="text/markdown",
                 key=f"dl_{ch['id']}"
@@ -488,6 +586,9 @@ def main():
 
     st.title(f"⚙️ {st.session_state.project['name']}")
 
+    # Warm the storage read cache for all four tabs in one concurrent round
+    storage.load_project_snapshot(st.session_state.project["id"])
+
     tab_bible, tab_baseline, tab_produce, tab_chapters = st.tabs([
         "📖 Bible", "📊 Baseline", "⚙️ Produce", "📄 Chapters"
     ])